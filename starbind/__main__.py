@@ -7,9 +7,14 @@
 ##############################################################################
 
 import argparse
-import re
 import os
+import shlex
+import shutil
+import hashlib
+import pickle
+from tempfile import mkstemp
 from starbind import MPI, OpenMPI, MPICH, OpenMP, Ptrace
+import tmap.topology
 from tmap.topology import Topology
 from tmap.permutation import Permutation
 
@@ -72,32 +77,101 @@ parser.add_argument('-v', '--verbose',
                     default=False, action='store_true')
 args = parser.parse_args()
 
+def topology_resources(obj_type, cache_dir='/dev/shm'):
+    """
+    Return the list of topology objects matching obj_type.
+    Topology discovery is slow and serializes on sysfs when every MPI rank
+    runs starbind. Matching objects are therefore pickled in cache_dir, keyed
+    on the kernel, the set of online cpus, the cgroup restricting them, the
+    HWLOC_* environment, the tmap installation and the type. The process cpu
+    affinity is left out: it differs between ranks but does not change the
+    discovered topology.
+    """
+    with open('/sys/devices/system/cpu/online', 'rb') as f:
+        online = f.read()
+    try:
+        with open('/proc/self/cgroup', 'rb') as f:
+            cgroup = f.read()
+    except OSError:
+        cgroup = b''
+    # A tmap upgrade rewrites its module, which invalidates older caches.
+    st = os.stat(tmap.topology.__file__)
+    version = '{}{}{}'.format(getattr(tmap, '__version__', ''), tmap.topology.__file__, st.st_mtime_ns)
+    hwloc_env = sorted((k, v) for k, v in os.environ.items() if k.startswith('HWLOC_'))
+    key = '{}{}{}{}{}{}'.format(os.uname(), online, cgroup, hwloc_env, version, obj_type.lower())
+    key = hashlib.sha256(key.encode()).hexdigest()[:16]
+    path = os.path.join(cache_dir, 'starbind-topo-{}-{}.pkl'.format(os.getuid(), key))
+
+    # Only trust a cache file written by ourselves.
+    try:
+        st = os.stat(path)
+        if st.st_uid == os.getuid() and not st.st_mode & 0o022:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception:
+        # Stale or corrupted cache: drop it and rebuild.
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    topology = Topology(structure=False)
+    resources = [ n for n in topology if hasattr(n, 'type') and obj_type.lower() in n.type.lower() ]
+    if len(resources) == 0:
+        return resources
+
+    # Write to a temporary file first: concurrent ranks may race on path.
+    try:
+        fd, tmp = mkstemp(dir=cache_dir)
+    except OSError:
+        return resources
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(resources, f)
+        os.replace(tmp, path)
+    except Exception:
+        # The cache is optional: never fail the launch on it.
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+    return resources
+
 # Get the list of topology resources
-topology = Topology(structure=False)
-resources = [ n for n in topology if hasattr(n, 'type') and args.type.lower() in n.type.lower() ]
-if args.singlify:
-    for r in resources:
-        r.PUs = [ r.PUs[0] ]
+resources = topology_resources(args.type)
 if len(resources) == 0:
+    topology = Topology(structure=False)
     raise ValueError('Invalid topology type {}. Valid types are: {}'\
                      .format(args.type, set(n.type for n in topology)))
+if args.singlify:
+    for r in resources:
+        r.PUs = [ r.PUs[0] ]
 
 # Apply permutation on resources
 permutation = Permutation(len(resources), args.permutation)
 resources = [ resources[i] for i in permutation.elements ]
 
-bin=args.command.split()[0]
+argv = shlex.split(args.command)
+# Resolve the binary path once for ldd and every launched process,
+# rather than walking PATH again in execvp() of each MPI rank.
+argv[0] = shutil.which(argv[0]) or argv[0]
+bin = argv[0]
 
 # Assign bind method
 if args.method == 'OpenMPI':
     binder = OpenMPI(resources, num_procs=args.num)
-if args.method == 'MPICH':
+elif args.method == 'MPICH':
     binder = MPICH(resources, num_procs=args.num)
 elif args.method == 'OpenMP':
     binder = OpenMP(resources, num_threads=args.num)
 elif args.method == 'ptrace':
     binder = Ptrace(resources)
-elif MPI.is_MPI_process() or MPI.is_MPI_application(bin):
+elif MPI.is_MPI_process():
+    binder = OpenMPI(resources, num_procs=args.num)
+# MPI and OpenMP detection share a single ldd call, ldd() is memoized.
+elif MPI.is_MPI_application(bin):
     binder = OpenMPI(resources, num_procs=args.num)
 elif OpenMP.is_OpenMP_application(bin):
     binder = OpenMP(resources, num_threads=args.num)
@@ -108,11 +182,11 @@ else:
 if args.verbose:
     if MPI.is_MPI_process():
         if MPI.get_rank() == 0:
-            print('Bind to: {!s}'.format(resources))
+            print('Bind to: {}'.format(', '.join(str(r.cpuset) for r in resources)))
             print('Bind with {}'.format(binder.__class__.__name__))
     else:
-        print('Bind to: {!s}'.format(resources))
+        print('Bind to: {}'.format(', '.join(str(r.cpuset) for r in resources)))
         print('Bind with {}'.format(binder.__class__.__name__))
 
 # Run command
-binder.run(args.command)
+binder.run(argv)
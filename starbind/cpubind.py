@@ -7,46 +7,116 @@
 import os
 import sys
 import ctypes
-import time
+import errno
 import subprocess
 import re
-from tempfile import mkstemp as tmp
-from itertools import cycle
-from signal import SIGSTOP, SIGCONT, SIGTRAP, SIGKILL, SIGCHLD
+import shlex
+from functools import lru_cache
+from collections import Counter
+from signal import SIGTRAP, SIGKILL, SIGCHLD
 from socket import gethostname
-from copy import deepcopy
-from datetime import timedelta
+
+# Characters allowed in library names listed by ldd.
+ldd_chars = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789/_-')
+
+@lru_cache(maxsize=64)
+def _ldd_(file, mtime, size):
+    # Without ldd, no library is detected and the Ptrace binder is used.
+    try:
+        out = subprocess.run(['ldd', file], stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    except OSError:
+        return ()
+    # Library lines look like "\tlibname.so.X => /path (0x...)".
+    libs = []
+    for line in out.splitlines():
+        if not line.startswith('\t'):
+            continue
+        name, sep, _ = line[1:].partition('.so')
+        if sep and name and ldd_chars.issuperset(name):
+            libs.append(name)
+    return tuple(libs)
 
 def ldd(file):
     """
-    Return a list of library names linked with the file.
+    Return a tuple of library names linked with the file.
+    Results are cached on the file real path, modification time and size.
+    """
+    try:
+        st = os.stat(file)
+    except OSError:
+        return ()
+    return _ldd_(os.path.realpath(file), st.st_mtime_ns, st.st_size)
+
+def argv(cmd):
+    """
+    Return the command cmd as an argv list.
+    A command line string is split with shlex.split(), a list is returned as is.
+    """
+    return shlex.split(cmd) if isinstance(cmd, str) else cmd
+
+@lru_cache(maxsize=None)
+def libc():
+    """
+    Return the C library handle.
+    libc is only loaded on first use, i.e when binding with ctypes calls.
+    """
+    return ctypes.CDLL('libc.so.6', use_errno=True)
+
+# Local host name, queried once for rankfiles and hostfiles.
+HOSTNAME = gethostname()
+
+def cpu_mask(resource):
+    """
+    Return a cpu_set_t bitmask of resource processing units.
+    The mask is built once and cached on the resource.
+    """
+    try:
+        return resource._mask
+    except AttributeError:
+        pass
+    bits = 0
+    for i in pu_indexes(resource):
+        bits |= 1 << i
+    nbits = 8 * ctypes.sizeof(ctypes.c_ulong)
+    mask = (ctypes.c_ulong * (bits.bit_length()//nbits + 1))()
+    for i in range(len(mask)):
+        mask[i] = (bits >> (i*nbits)) & ((1 << nbits) - 1)
+    resource._mask = mask
+    return mask
+
+def pu_indexes(resource):
     """
-    regex = re.compile('\t(?P<m>[a-zA-Z0-9/_\-]+)[.]so.*')
-    out = subprocess.getoutput("ldd "+file)
-    out = out.split('\n')
-    out = [ regex.match(o) for o in out ]
-    out = [ o.group(1) for o in out if o is not None ]
-    return out
-
-def bind_process(resource, pid):
+    Return the tuple of resource processing units os indexes.
+    The tuple is built once and cached on the resource.
     """
-    Function to bind thread on next resource.
+    try:
+        return resource._pu_indexes
+    except AttributeError:
+        pass
+    resource._pu_indexes = tuple(pu.os_index for pu in resource.PUs)
+    return resource._pu_indexes
+
+def set_affinity(mask, pid):
     """
-    cmd = 'hwloc-bind --cpubind {} --pid {}'.format(resource.cpuset, pid)
-    subprocess.getoutput(cmd)
+    Bind pid on a mask returned by cpu_mask().
+    """
+    return libc().sched_setaffinity(pid, ctypes.sizeof(mask), ctypes.byref(mask))
 
-def bind_thread(resource, tid):
+def bind_self(resource):
     """
-    Function to bind thread on next resource.
+    Function to bind the calling process on resource.
     """
-    cmd = 'hwloc-bind --cpubind {} --tid {}'.format(resource.cpuset, tid)
-    subprocess.getoutput(cmd)
+    os.sched_setaffinity(0, pu_indexes(resource))
 
 class Binding:
     """
     Base class representing a binding method.
     """
 
+    # File descriptors the launched command must inherit.
+    pass_fds = ()
+
     def __init__(self, resource_list):
         """
         Standard initializer.
@@ -60,27 +130,17 @@ class Binding:
     def run(self, cmd, env=os.environ):
         """
         Subprocess launcher enforcing binding.
-        @param cmd: The command line string to launch.
+        @param cmd: The command line argv list or string to launch.
         """
-        cmd = cmd.split()
+        cmd = argv(cmd)
         return os.execvpe(cmd[0], cmd, env)
 
-    def getoutput(self, cmd):
+    def getoutput(self, cmd, env=os.environ):
         """
-        Run command with binder and return output in a string
+        Run command argv list or string with binder and return output in a string
         """
-        r, w = os.pipe()
-        pid = os.fork()
-        if pid:
-            os.close(w)
-            os.waitpid(pid, 0)
-            return os.fdopen(r).read()
-        else:
-            os.close(r)
-            os.dup2(w, sys.stdout.fileno())
-            self.run(cmd)
-            os.close(w)
-            os._exit(0)
+        return subprocess.run(argv(cmd), stdout=subprocess.PIPE, env=env,
+                              pass_fds=self.pass_fds, universal_newlines=True).stdout
 
 
 class OpenMP(Binding):
@@ -91,10 +151,12 @@ class OpenMP(Binding):
     """
 
     def __init__(self, resource_list, num_threads=None):
+        # Only the first num_threads places are used when there are fewer
+        # threads than places. Leave the others out of OMP_PLACES.
+        if type(num_threads) is int and 0 < num_threads < len(resource_list):
+            resource_list = resource_list[:num_threads]
         super().__init__(resource_list)
-        places = [ '{{{}}}'.format(','.join([ str(pu.os_index) for pu in r.PUs ])) for r in resource_list ]
-        places = '{}'.format(', '.join(places))
-        self.OMP_PLACES=places
+        self.OMP_PLACES = ', '.join('{%s}' % ','.join(map(str, pu_indexes(r))) for r in resource_list)
         if num_threads is not None:
             if type(num_threads) is int:
                 self.OMP_NUM_THREADS=str(num_threads)
@@ -104,18 +166,27 @@ class OpenMP(Binding):
     def __str__(self):
         return 'OMP_NUM_THREADS:{}\nOMP_PLACES{}'.format(self.OMP_NUM_THREADS, self.OMP_PLACES)
 
-    def run(self, cmd, num_threads=False):
-        cmd = cmd.split()
-        os.environ['OMP_PLACES'] = self.OMP_PLACES
+    def environ(self):
+        """
+        Return a copy of the process environment with OMP_PLACES and
+        OMP_NUM_THREADS set. OMP_PLACES is computed once in the initializer.
+        """
+        env = dict(os.environ, OMP_PLACES=self.OMP_PLACES)
         if hasattr(self, 'OMP_NUM_THREADS'):
-            os.environ['OMP_NUM_THREADS'] = self.OMP_NUM_THREADS            
-        os.execvpe(cmd[0], cmd, os.environ)
+            env['OMP_NUM_THREADS'] = self.OMP_NUM_THREADS
+        return env
+
+    def run(self, cmd):
+        return Binding.run(self, cmd, self.environ())
+
+    def getoutput(self, cmd):
+        return Binding.getoutput(self, cmd, self.environ())
 
     ldd_regex = re.compile('(lib.*omp$)|(lib.*openmp.*)')
     @staticmethod
     def is_OpenMP_application(filename):
         libs = ldd(filename)
-        return any([ OpenMP.ldd_regex.match(l) for l in libs ])
+        return any(OpenMP.ldd_regex.match(l) for l in libs)
 
 class Ptrace(Binding):
     """
@@ -129,7 +200,17 @@ class Ptrace(Binding):
     This will only work if the value are correctly set for your operating system.
     """
 
-    ptrace = ctypes.CDLL(None).ptrace
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _ptrace_():
+        """
+        Return libc ptrace() function, with its prototype set on first use.
+        """
+        # long ptrace(enum __ptrace_request request, pid_t pid, void *addr, void *data)
+        ptrace = libc().ptrace
+        ptrace.argtypes = [ ctypes.c_long, ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p ]
+        ptrace.restype = ctypes.c_long
+        return ptrace
 
     PTRACE_TRACEME = 0
     PTRACE_EVENT_FORK = 1
@@ -139,123 +220,217 @@ class Ptrace(Binding):
     PTRACE_CONT = 7
     PTRACE_DETACH = 17
     PTRACE_SEIZE = int('0x4206', 16)
+    PTRACE_SETOPTIONS = int('0x4200', 16)
     PTRACE_GETEVENTMSG = int('0x4201', 16)
     PTRACE_O_TRACECLONE = int('0x00000008', 16)
     PTRACE_O_TRACEFORK = int('0x00000002', 16)
+    PTRACE_O_TRACEVFORK = int('0x00000004', 16)
+    # Only fork(), vfork() and clone() events need to stop the tracee.
+    PTRACE_OPTIONS = PTRACE_O_TRACECLONE|PTRACE_O_TRACEFORK|PTRACE_O_TRACEVFORK
+    # Values of status>>8 for fork(), vfork() and clone() event stops.
+    CLONE_EVENTS = frozenset(SIGTRAP|(e<<8) for e in (PTRACE_EVENT_FORK, PTRACE_EVENT_VFORK, PTRACE_EVENT_CLONE))
+
+    # PTRACE_GETEVENTMSG output buffer, reused for every event.
+    eventmsg = ctypes.c_ulong(0)
 
     def __init__(self, resource_list):
         """
         Ptrace resource_list initializer is cycling on resource list in a round-robin fashion.
+        Resources cpu masks are computed here once for all the traced events.
         """
-        self.resources = cycle(resource_list)
+        self.masks = tuple(cpu_mask(r) for r in resource_list)
+        self.next_index = 0
         super().__init__(resource_list)
 
     def bind_next_thread(self, pid):
-        bind_thread(next(self.resources), pid)
+        mask = self.masks[self.next_index % len(self.masks)]
+        self.next_index += 1
+        if set_affinity(mask, pid) == -1:
+            # ESRCH: the thread already exited.
+            err = ctypes.get_errno()
+            if err != errno.ESRCH:
+                print("tracer: sched_setaffinity: {}".format(os.strerror(err)))
 
     @staticmethod
     def trace_pid(pid, fn, *args, **kwargs):
         """
         Internal method of tracer to process signals from tracee and catch clone(), fork(), vfork() syscalls()
-        @arg pid is the pid of the process to trace
+        @arg pid is the pid of the process to trace. The process must have
+        called PTRACE_TRACEME before execve().
         @arg fn is a function that takes a pid as first argument and that will be called on this
         process and its child processes.
         @args: fn other arguments.
         @kwargs: fn other keyword arguments.
         """
-        if Ptrace.ptrace(Ptrace.PTRACE_SEIZE, ctypes.c_int32(pid), None,
-                         ctypes.c_uint64(Ptrace.PTRACE_O_TRACECLONE|Ptrace.PTRACE_O_TRACEFORK)) == -1:
+        ptrace = Ptrace._ptrace_()
+        # The tracee stops on SIGTRAP once execve() succeeded.
+        _, status = os.waitpid(pid, 0)
+        if os.WIFEXITED(status):
+            return os.WEXITSTATUS(status)
+        if os.WIFSIGNALED(status):
+            return 0
+        if ptrace(Ptrace.PTRACE_SETOPTIONS, pid, None, Ptrace.PTRACE_OPTIONS) == -1:
+            err = ctypes.get_errno()
             os.kill(pid, SIGKILL);
-            raise Exception('ptrace syscall failed.')
+            raise OSError(err, 'ptrace(PTRACE_SETOPTIONS): {}'.format(os.strerror(err)))
         else:
             fn(pid, *args, **kwargs)
-            os.kill(pid, SIGCONT);
+            ptrace(Ptrace.PTRACE_CONT, pid, None, None)
+
+        # Names used for every event are looked up once.
+        clone_events = Ptrace.CLONE_EVENTS
+        eventmsg = Ptrace.eventmsg
+        eventmsg_ref = ctypes.byref(eventmsg)
+        WIFSTOPPED, WSTOPSIG = os.WIFSTOPPED, os.WSTOPSIG
         while True:
-            child, status = os.waitpid(-1, 0)
-            if child == pid:
-                if os.WIFEXITED(status):
-                    return os.WEXITSTATUS(status)
-                if os.WIFSIGNALED(status):
-                    return 0
-            if os.WIFSTOPPED(status):
-                sig = os.WSTOPSIG(status)
-                if sig == SIGTRAP:
-                    event = status >> 8
-                    eventmsg = ctypes.c_int64(0)
-                    if Ptrace.ptrace(Ptrace.PTRACE_GETEVENTMSG, child, 0, ctypes.pointer(eventmsg)) == -1:
-                        print("tracer: PTRACE_GETEVENTMSG")
-                        break
-                    if event == (SIGTRAP|(Ptrace.PTRACE_EVENT_FORK<<8)) or event == (SIGTRAP|(Ptrace.PTRACE_EVENT_VFORK<<8)) or event == (SIGTRAP|(Ptrace.PTRACE_EVENT_CLONE<<8)):
-                        fn(eventmsg.value, *args, **kwargs)
-                # MPI seams to exit on this status while the others do not work.
-                # os.WIFSTOPPED(4479) = True
-                # os.WSTOPSIG(4479) = SIGCHLD
-                elif sig == SIGCHLD and child == pid:
+            # Block for one event, then drain every pending event before
+            # blocking again.
+            events = [ os.waitpid(-1, 0) ]
+            while True:
+                try:
+                    child, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if child == 0:
                     break
-                if Ptrace.ptrace(Ptrace.PTRACE_CONT, child, 0, 0) == -1:
-                    pass # raise Exception('PTRACE_CONT(interrupt)')
+                events.append((child, status))
+
+            for child, status in events:
+                if child == pid:
+                    if os.WIFEXITED(status):
+                        return os.WEXITSTATUS(status)
+                    if os.WIFSIGNALED(status):
+                        return 0
+                if WIFSTOPPED(status):
+                    sig = WSTOPSIG(status)
+                    if sig == SIGTRAP:
+                        # Only fork/clone event stops carry a new child pid.
+                        if (status >> 8) in clone_events:
+                            if ptrace(Ptrace.PTRACE_GETEVENTMSG, child, None, eventmsg_ref) == -1:
+                                print("tracer: PTRACE_GETEVENTMSG: {}".format(os.strerror(ctypes.get_errno())))
+                                return
+                            fn(eventmsg.value, *args, **kwargs)
+                    # MPI seams to exit on this status while the others do not work.
+                    # os.WIFSTOPPED(4479) = True
+                    # os.WSTOPSIG(4479) = SIGCHLD
+                    elif sig == SIGCHLD and child == pid:
+                        return
+                    if ptrace(Ptrace.PTRACE_CONT, child, None, None) == -1:
+                        # ESRCH: the tracee was killed meanwhile.
+                        err = ctypes.get_errno()
+                        if err != errno.ESRCH:
+                            print("tracer: PTRACE_CONT: {}".format(os.strerror(err)))
 
     def run(self, cmd):
         """
         Subprocess launcher enforcing binding.
-        fork execvp the command line. Stop child until ptrace is started then resume child.
-        @param cmd: The command line string to launch.
+        fork execvp the command line. The child requests to be traced and
+        stops on execve() until the tracer has set ptrace options.
+        @param cmd: The command line argv list or string to launch.
         """
+        cmd = argv(cmd)
+        ptrace = Ptrace._ptrace_()
         pid = os.fork()
         if pid == 0:
-            pid = os.getpid()
-            cmd = cmd.split()
-            os.kill(pid, SIGSTOP)
-            os.execvp(cmd[0], cmd)
+            # An untraced command would run unbound: do not exec it.
+            if ptrace(Ptrace.PTRACE_TRACEME, 0, None, None) == -1:
+                err = ctypes.get_errno()
+                print('ptrace(PTRACE_TRACEME): {}'.format(os.strerror(err)), file=sys.stderr)
+                os._exit(127)
+            try:
+                os.execvp(cmd[0], cmd)
+            except OSError as e:
+                print('{}: {}'.format(cmd[0], e.strerror), file=sys.stderr)
             os._exit(127)
         else:
             Ptrace.trace_pid(pid, self.bind_next_thread)
             os._exit(0)
 
+    def getoutput(self, cmd):
+        """
+        Run command argv list with binder and return output in a string.
+        The tracer has to be the parent of the command. It is therefore forked
+        with its output redirected to a pipe read until the command exits.
+        """
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid:
+            os.close(w)
+            with os.fdopen(r) as f:
+                out = f.read()
+            os.waitpid(pid, 0)
+            return out
+        else:
+            os.close(r)
+            os.dup2(w, sys.stdout.fileno())
+            os.close(w)
+            self.run(cmd)
+            os._exit(0)
+
 class MPI(Binding):
     ldd_regex = re.compile('(lib.*mpi$)|(lib.*mpich)')
     rank_regex = re.compile('.*MPI.*LOCAL_RANK.*')
-
-    def __init__(self, resource_list, num_procs, env={}, launcher='mpirun'):
+    # Local rank variables of OpenMPI, MPICH, MVAPICH and other PMI launchers.
+    rank_keys = ('OMPI_COMM_WORLD_LOCAL_RANK', 'MPI_LOCALRANKID', 'MV2_COMM_WORLD_LOCAL_RANK', 'PMI_LOCAL_RANK')
+    # Name of the local rank environment variable, resolved once at import.
+    # Known names are looked up first, other names are matched with rank_regex.
+    rank_env = next(filter(os.environ.__contains__, rank_keys), None) or \
+               next(filter(rank_regex.match, os.environ.keys()), None)
+
+    def __init__(self, resource_list, num_procs, env=None, launcher='mpirun'):
         Binding.__init__(self, resource_list)
         num_procs = num_procs if num_procs is not None else len(resource_list)
-        for k in env.keys():
-            if k in os.environ.keys():
-                os.environ[k] = '{}:{}'.format(os.environ[k], env[k])
-            else:
-                os.environ[k] = env[k]
+        # Variables of env are appended to the ones of the process environment
+        # in a copy passed to the launched command.
+        self.env = dict(os.environ)
+        for k, v in (env if env is not None else {}).items():
+            self.env[k] = '{}:{}'.format(self.env[k], v) if k in self.env else v
         if MPI.is_MPI_process():
             resource = resource_list[MPI.get_rank() % len(resource_list)]
-            bind_process(resource, os.getpid())
+            bind_self(resource)
+            self.launcher_argv = []
         else:
-            launcher = '{} -np {}'.format(launcher, num_procs)
-            self.launcher = launcher
-            self.run = lambda cmd: MPI.mpirun(launcher, cmd)
+            self.launcher = '{} -np {}'.format(launcher, num_procs)
+            self.launcher_argv = self.launcher.split()
+
+    def run(self, cmd):
+        MPI.mpirun(self.launcher_argv, cmd, self.env)
+
+    def getoutput(self, cmd):
+        return Binding.getoutput(self, self.launcher_argv + argv(cmd), self.env)
 
     @staticmethod
-    def mpirun(launcher, cmd):
-        cmd = '{} {}'.format(launcher, cmd)
-        cmd = cmd.split()
-        os.execvpe(cmd[0], cmd, os.environ)
+    def mpirun(launcher, cmd, env=os.environ):
+        """
+        Exec cmd with the launcher argv list prepended.
+        """
+        cmd = launcher + argv(cmd)
+        os.execvpe(cmd[0], cmd, env)
 
     @staticmethod
     def is_MPI_application(filename):
         libs = ldd(filename)
-        return any([ MPI.ldd_regex.match(l) for l in libs ])
+        return any(MPI.ldd_regex.match(l) for l in libs)
 
     @staticmethod
     def is_MPI_process():
         """
         Return True if one of local rank environment variables are defined.
         """
-        return any(MPI.rank_regex.match(k) for k in os.environ.keys())
+        return MPI.rank_env is not None
 
     @staticmethod
-    def get_rank(env=os.environ):
+    def get_rank(env=None):
         """
         Return the rank of local mpi process.
+        @param env: An environment dictionary to search instead of the
+        process environment.
         """
-        return int(next(v for k,v in env.items() if MPI.rank_regex.match(k)))
+        if env is None:
+            return int(os.environ[MPI.rank_env])
+        key = next(filter(env.__contains__, MPI.rank_keys), None) or \
+              next(filter(MPI.rank_regex.match, env.keys()))
+        return int(env[key])
 
 class OpenMPI(MPI):
     """
@@ -273,20 +448,28 @@ class OpenMPI(MPI):
     }
 
     @staticmethod
-    def _rankfile_(resources):
+    def _homogeneous_(resources):
+        """
+        Return True if all resources have the same type.
+        """
+        return len({ r.type for r in resources }) == 1
+
+    @staticmethod
+    def _rankfile_(resources, homogeneous=None):
         """
         Return a list of strings where each item is a line of the rankfile
         binding in the order of the resource list.
+        @param homogeneous: Whether all resources have the same type, see
+        _homogeneous_(). Computed when not provided.
         """
-        hostname=gethostname()
-
+        if homogeneous is None:
+            homogeneous = OpenMPI._homogeneous_(resources)
         # If all resources are of the same type, the knob `--bind-to` will be
         # set to this resource and we just have to output slots for these
         # resources logical index.
-        if all([ r.type==resources[0].type for r in resources]) and\
-           resources[0].type in OpenMPI.RESOURCE_MAP.keys():
+        if homogeneous and resources[0].type in OpenMPI.RESOURCE_MAP.keys():
             return [ "rank {}={} slot={}".format(i,
-                                                 r.hostname if hasattr(r, 'hostname') else hostname,
+                                                 r.hostname if hasattr(r, 'hostname') else HOSTNAME,
                                                  r.logical_index) for i, r in zip(range(len(resources)), resources) ]
 
     @staticmethod
@@ -295,16 +478,14 @@ class OpenMPI(MPI):
         Return a list of strings where each item is a line of the rankfile
         binding in the order of the resource list.
         """
-        hosts = set([r.hostname for r in resources if hasattr(r, 'hostname')])
+        hosts = Counter(r.hostname for r in resources if hasattr(r, 'hostname'))
         if len(hosts) == 0:
-            hosts = { gethostname(): len([resources])}
-        else:
-            hosts = { h: len([r for r in resources if hasattr(r, 'hostname') and r.hostname == h ]) for h in hosts }
+            hosts = { HOSTNAME: len(resources) }
 
         return [ '{} slots={} max_slots={}'.format(h, n, n) for (h,n) in hosts.items() ]
     
     @staticmethod
-    def _bindto_knob_(resources):
+    def _bindto_knob_(resources, homogeneous=None):
         """
         Returns the knob specifying the type of objects to bind to.
         If all resources are of the same type then the knob is to bind to this
@@ -323,8 +504,12 @@ class OpenMPI(MPI):
                       qualifiers: overload-allowed, if-supported,
                       ordered
         ```
+        @param homogeneous: Whether all resources have the same type, see
+        _homogeneous_(). Computed when not provided.
         """
-        if all([ r.type==resources[0].type for r in resources]):
+        if homogeneous is None:
+            homogeneous = OpenMPI._homogeneous_(resources)
+        if homogeneous:
             try:
                 return '--bind-to {}'.format(OpenMPI.RESOURCE_MAP[resources[0].type])
             except KeyError:
@@ -332,26 +517,53 @@ class OpenMPI(MPI):
         return '--bind-to hwthread'
     
     def __init__(self, resource_list, num_procs=None,
-                 env={},
-                 knobs=[]):
-        
-        # Write rankfile
-        f, self.rankfile = tmp(dir=os.getcwd(), text=True)
-        file = os.fdopen(f, 'w')
-        for l in OpenMPI._rankfile_(resource_list):
-            file.write(l + '\n')
-        file.close()
+                 env=None,
+                 knobs=None):
+        self.rankfile = None
+
+        # Inside an MPI rank the process is only bound to its resource, the
+        # launcher and its rankfile are not needed.
+        if MPI.is_MPI_process():
+            MPI.__init__(self, resource_list, num_procs, env)
+            return
+
+        homogeneous = OpenMPI._homogeneous_(resource_list)
+
+        rankfile = ''.join(l + '\n' for l in OpenMPI._rankfile_(resource_list, homogeneous)).encode()
+        if hasattr(os, 'memfd_create'):
+            # Write rankfile in an anonymous memory file inherited by mpirun,
+            # which opens it through its own /proc/self/fd entry.
+            self.rankfd = os.memfd_create('rankfile', 0)
+            os.set_inheritable(self.rankfd, True)
+            os.write(self.rankfd, rankfile)
+            self.rankfile = '/proc/self/fd/{}'.format(self.rankfd)
+            self.pass_fds = (self.rankfd,)
+        else:
+            # Python < 3.8: write rankfile in a temporary file removed on deletion.
+            from tempfile import mkstemp
+            self.rankfd = None
+            f, self.rankfile = mkstemp(text=True)
+            os.write(f, rankfile)
+            os.close(f)
 
         # Set knobs
-        knobs.append(OpenMPI._bindto_knob_(resource_list))
+        knobs = list(knobs) if knobs is not None else []
+        knobs.append(OpenMPI._bindto_knob_(resource_list, homogeneous))
         launcher = 'mpirun {} -rf {}'.format(' '.join(knobs), self.rankfile)
     
         MPI.__init__(self, resource_list, num_procs, env, launcher=launcher)
 
     def __del__(self):
-        os.remove(self.rankfile)
+        if self.rankfile is None:
+            return
+        if self.rankfd is None:
+            os.remove(self.rankfile)
+        else:
+            os.close(self.rankfd)
 
     def __str__(self):
+        if self.rankfile is None:
+            return MPI.__str__(self)
         with open(self.rankfile, 'r') as f:
             return '{}\n{}'.format(self.launcher, ''.join(f.readlines()))
 
@@ -359,10 +571,9 @@ class MPICH(MPI):
     """
     MPI binding for MPICH.
     """
-    def __init__(self, resource_list, num_procs=None, env={}):
+    def __init__(self, resource_list, num_procs=None, env=None):
         num_procs = num_procs if num_procs is not None else len(resource_list)
-        binding = [ '+'.join([ str(pu.os_index) for pu in r.PUs]) for r in resource_list ]
-        binding = 'user:{}'.format(','.join(binding))
+        binding = 'user:{}'.format(','.join('+'.join(map(str, pu_indexes(r))) for r in resource_list))
         launcher = 'mpirun -launcher fork -bind-to {}'.format(binding)
         MPI.__init__(self, resource_list, num_procs, env, launcher)
 
@@ -384,8 +595,8 @@ if __name__ == '__main__':
     def test_binder(binder_name, binder, resources, cmd):
         out = binder.getoutput(cmd)
         out = out.split('\n')
-        cpusets = [r.cpuset for r in resources]
-        match = all([ x == y for x, y in zip(cpusets, out) ])
+        cpusets = tuple(r.cpuset for r in resources)
+        match = cpusets == tuple(out[:len(cpusets)])
         if match:
             print('Test {}: success'.format(binder_name))
         else:
@@ -399,32 +610,32 @@ if __name__ == '__main__':
     def test_resources(resources):
         if MPI.is_MPI_process():
             rank = MPI.get_rank()
-            cmd = test_dir + os.path.sep + 'mpi'
+            cmd = [ test_dir + os.path.sep + 'mpi' ]
             mpi = MPI(resources, len(resources))
             test_binder('MPI', mpi, [resources[rank % len(resources)]], cmd)
             os._exit(0)
 
         # Test Openmp
-        cmd = test_dir + os.path.sep + 'openmp'
+        cmd = [ test_dir + os.path.sep + 'openmp' ]
         binder = OpenMP(resources, num_threads=len(resources))
         test_binder('OpenMP', binder, resources, cmd)
 
         # Test openmp / ptrace
-        cmd = test_dir + os.path.sep + 'openmp ' + str(len(resources))
+        cmd = [ test_dir + os.path.sep + 'openmp', str(len(resources)) ]
         test_binder('OpenMP + ptrace', binder, resources, cmd)
 
         # Test OpenMPI
-        cmd = test_dir + os.path.sep + 'mpi'
+        cmd = [ test_dir + os.path.sep + 'mpi' ]
         binder = OpenMPI(resources, num_procs=len(resources))
         test_binder('OpenMPI', binder, resources, cmd)
     
         # Test pthread / ptrace
-        # cmd = test_dir + os.path.sep + 'pthread ' + str(len(resources))
+        # cmd = [ test_dir + os.path.sep + 'pthread', str(len(resources)) ]
         # binder = Ptrace(resources)
         # test_binder('pthread + ptrace', binder, resources, cmd)
 
         # Test MPICH
-        # cmd = test_dir + os.path.sep + 'mpi'
+        # cmd = [ test_dir + os.path.sep + 'mpi' ]
         # binder = MPICH(resources, num_procs=len(resources))
         # test_binder('MPICH', binder, resources, cmd)
 
@@ -432,7 +643,7 @@ if __name__ == '__main__':
     test_dir = '{}/{}/tests'.format(os.path.dirname(os.path.abspath(__file__)),
                                     os.path.pardir)
     # Build tests
-    subprocess.getoutput('make -C ' + test_dir)
+    subprocess.run(['make', '-C', test_dir], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
     for t in OpenMPI.RESOURCE_MAP.keys():
         resources = [ n for n in topology if hasattr(n, 'type') and n.type == t ]